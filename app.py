@@ -1,13 +1,114 @@
+import functools
 import io
+import multiprocessing
+import os
 import re
+import tempfile
 import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 
+import pymupdf
 import streamlit as st
-from pypdf import PdfReader, PdfWriter
+
+from pdf_workers import build_pdf, build_pdfs, doc_page_texts, extract_page_texts
+
+
+# Patterns are compiled once at import time instead of on every page.
+# Depot ID: primary (digits before the label) and fallback (digits after the
+# label) are fused into one alternation so the page text is scanned once.
+# The fallback gap is bounded so a stray label can't drag the search across
+# the rest of the page.
+_DEPOT_COMBINED = re.compile(
+    r"(?P<a>\d{4})\s*[\r\n]+\s*Depot ID|Depot ID[^\d]{1,64}(?P<b>\d{4})",
+    re.IGNORECASE | re.DOTALL,
+)
+_SHIPPING_POINT = re.compile(r"Shipping Point\s*:\s*([0-9]{3}V)")
+
+# The Depot ID / Shipping Point markers sit near the top of each page.
+_HEADER_CHARS = 1024
+
+# Below this many pages, starting a process pool costs more than it saves
+# (~0.25s to start a forkserver pool vs ~1.3ms of text extraction per page).
+_PARALLEL_MIN_PAGES = 500
+
+# The same for building the output PDFs, which is much cheaper per page
+# (~0.2ms to copy and serialize a page), so a pool pays off only later.
+_PARALLEL_MIN_BUILD_PAGES = 2000
+
+# Upper bound on pool size; each worker holds its own parsed copy of the PDF.
+_MAX_WORKERS = 8
+
+
+# --------- Process pool helpers --------- #
+
+def _worker_count(num_tasks: int) -> int:
+    """
+    Number of pool workers for `num_tasks` tasks: the CPUs this process may
+    run on (respecting affinity / cpusets), capped at _MAX_WORKERS.
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:  # not available on macOS / Windows
+        cpus = os.cpu_count() or 1
+    return max(1, min(cpus, num_tasks, _MAX_WORKERS))
+
+
+def _run_in_pool(fn, pdf_bytes: bytes, workers: int, *arg_lists):
+    """
+    Call fn(pdf_path, *args) for each set of args in a process pool and
+    yield the results in order as they arrive. Callers must consume the
+    generator fully, so that the pool and the temporary file are released.
+
+    The PDF is written once to a temporary file that workers open by path,
+    instead of pickling the whole upload into every task. Workers are
+    started with forkserver (spawn where unavailable): forking the
+    multi-threaded Streamlit server process can deadlock.
+    """
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pdf_path = os.path.join(tmp_dir, "upload.pdf")
+        with open(pdf_path, "wb") as f:
+            f.write(pdf_bytes)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as ex:
+            yield from ex.map(fn, repeat(pdf_path), *arg_lists)
 
 
 # --------- Common extraction helpers --------- #
 
+def _search_header_first(pattern: re.Pattern, text: str):
+    """
+    Search the first _HEADER_CHARS characters of the page text, and only
+    scan the full text if the header has no match.
+    """
+    match = pattern.search(text, 0, _HEADER_CHARS)
+    if match is None and len(text) > _HEADER_CHARS:
+        match = pattern.search(text)
+    return match
+
+
+def _page_texts(pdf_bytes: bytes) -> list[str]:
+    """
+    Extract the text of every page of the PDF.
+
+    Not cached itself: both callers (split_call_list / split_group_list)
+    are cached on the same PDF bytes. Large PDFs are split into page
+    ranges extracted in parallel processes.
+    """
+    with pymupdf.open(stream=pdf_bytes, filetype="pdf") as doc:
+        num_pages = doc.page_count
+        workers = _worker_count(num_pages)
+        if workers < 2 or num_pages < _PARALLEL_MIN_PAGES:
+            return doc_page_texts(doc, 0, num_pages)
+
+    chunk = -(-num_pages // workers)  # ceil division
+    starts = range(0, num_pages, chunk)
+    stops = [min(start + chunk, num_pages) for start in starts]
+    parts = _run_in_pool(extract_page_texts, pdf_bytes, workers, starts, stops)
+    return [text for part in parts for text in part]
+
+
 def extract_depot_id_from_text(text: str) -> str:
     """
     Extracts the Depot ID from the full page text for the Call List.
@@ -15,32 +116,40 @@ def extract_depot_id_from_text(text: str) -> str:
     In your Call List PDF, the 4-digit depot ID (e.g. 2104) appears before
     the 'Depot ID' label, stuck to another value like '1:34' → '1:342104'.
 
-    Strategy:
+    Strategy (single pass):
       1) Look for a 4-digit number immediately before a newline and 'Depot ID'.
       2) Fallback: look for a 4-digit number after 'Depot ID'.
     """
     if not text:
         return "UNKNOWN"
 
-    # Primary pattern: 4 digits followed by newline then 'Depot ID'
-    match = re.search(r"(\d{4})\s*[\r\n]+\s*Depot ID", text, flags=re.IGNORECASE)
-    if match:
-        return match.group(1)
-
-    # Fallback: 'Depot ID' then some non-digits then a 4-digit number
-    match2 = re.search(r"Depot ID[^\d]+(\d{4})", text,
-                       flags=re.IGNORECASE | re.DOTALL)
-    if match2:
-        return match2.group(1)
+    pos = text.find("Depot ID")
 
-    return "UNKNOWN"
+    # No label at all (in any case) means no match. 'depot' is the sentinel
+    # rather than 'depot id' because IGNORECASE also lets 'ı'/'İ' match 'i'.
+    if pos < 0 and "depot" not in text.lower():
+        return "UNKNOWN"
 
+    # Common case, without a regex: the digits end the last non-blank line
+    # above the first 'Depot ID' label. Only taken when no other spelling
+    # of the label comes earlier, so the result is the same as the regex's
+    # leftmost match.
+    if pos >= 0 and "depot" not in text[:pos].lower():
+        i = pos
+        while i and text[i - 1].isspace():
+            i -= 1
+        gap = text[i:pos]
+        if i >= 4 and text[i - 4:i].isdecimal() and ("\n" in gap or "\r" in gap):
+            return text[i - 4:i]
+
+    match = _search_header_first(_DEPOT_COMBINED, text)
+    if match:
+        return match.group("a") or match.group("b")
 
-def extract_depot_id(page) -> str:
-    text = page.extract_text() or ""
-    return extract_depot_id_from_text(text)
+    return "UNKNOWN"
 
 
+@functools.lru_cache(maxsize=None)
 def depot_id_to_filename(depot_id: str) -> str:
     """
     Convert depot_id '2104' → filename '104V_CL.pdf'
@@ -67,19 +176,19 @@ def extract_shipping_point_from_text(text: str) -> str:
     if not text:
         return "UNKNOWN"
 
+    # No label means no match, without running the regex.
+    if "Shipping Point" not in text:
+        return "UNKNOWN"
+
     # Look for "Shipping Point    :  123V"
-    match = re.search(r"Shipping Point\s*:\s*([0-9]{3}V)", text)
+    match = _search_header_first(_SHIPPING_POINT, text)
     if match:
         return match.group(1)
 
     return "UNKNOWN"
 
 
-def extract_shipping_point(page) -> str:
-    text = page.extract_text() or ""
-    return extract_shipping_point_from_text(text)
-
-
+@functools.lru_cache(maxsize=None)
 def shipping_point_to_filename(sp: str) -> str:
     """
     For the Group List:
@@ -92,6 +201,146 @@ def shipping_point_to_filename(sp: str) -> str:
     return f"{base}_Group.pdf"
 
 
+# --------- PDF output helpers --------- #
+
+def _zip_groups(pdf_bytes: bytes, groups: dict, to_filename) -> bytes:
+    """
+    Build one PDF per group and return them zipped, named by `to_filename`.
+
+    Copying and serializing pages is CPU-bound, so with enough pages and
+    several groups the groups are split into batches built in parallel
+    processes; otherwise each PDF is built here. Either way each PDF is
+    written into the ZIP as soon as it (or its batch) is ready.
+    """
+    page_lists = list(groups.values())
+    num_pages = sum(len(page_indices) for page_indices in page_lists)
+    workers = _worker_count(len(page_lists))
+
+    zip_buffer = io.BytesIO()
+    with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_STORED) as zip_file:
+        if workers < 2 or num_pages < _PARALLEL_MIN_BUILD_PAGES:
+            with pymupdf.open(stream=pdf_bytes, filetype="pdf") as doc:
+                for group_id, page_indices in groups.items():
+                    zip_file.writestr(to_filename(group_id), build_pdf(doc, page_indices))
+        else:
+            chunk = -(-len(page_lists) // workers)  # ceil division
+            batches = [page_lists[i:i + chunk] for i in range(0, len(page_lists), chunk)]
+            group_ids = iter(groups)
+            for part in _run_in_pool(build_pdfs, pdf_bytes, workers, batches):
+                for pdf in part:
+                    zip_file.writestr(to_filename(next(group_ids)), pdf)
+    return zip_buffer.getvalue()
+
+
+# --------- Splitting --------- #
+#
+# Both splitters are cached on the PDF bytes (separately per tool), so
+# clicking Split again, or switching tools and coming back, with the same
+# upload returns the previous result instead of reprocessing the PDF.
+# Each result holds a full ZIP, so the caches are kept small and expire.
+
+_SPLIT_CACHE_ENTRIES = 4
+_SPLIT_CACHE_TTL = "1h"
+
+
+@st.cache_data(show_spinner=True, max_entries=_SPLIT_CACHE_ENTRIES, ttl=_SPLIT_CACHE_TTL)
+def split_call_list(pdf_bytes: bytes) -> dict:
+    """
+    Split a Call List PDF by Depot ID.
+
+    Returns a dict with:
+      - num_pages, log_lines
+      - depot_ids: groups in order of first appearance
+      - unknown_attached: pages with UNKNOWN attached to the previous depot
+      - unknown_unassigned: pages left as UNKNOWN (no previous depot)
+      - zip_bytes: one '<depot>_CL.pdf' per depot
+    """
+    page_texts = _page_texts(pdf_bytes)
+
+    depot_pages = {}  # depot_id -> [page_index, ...]
+    last_depot_id = None
+
+    unknown_attached = []   # pages with UNKNOWN attached to previous depot
+    unknown_unassigned = [] # pages truly left as UNKNOWN
+    log_lines = []          # per-page log, shown once after the loop
+
+    # Process each page
+    for page_index, text in enumerate(page_texts):
+        page_num = page_index + 1
+        depot_id_raw = extract_depot_id_from_text(text)
+
+        if depot_id_raw == "UNKNOWN":
+            if last_depot_id is not None:
+                effective_depot_id = last_depot_id
+                unknown_attached.append(
+                    {"page": page_num, "assigned_to": last_depot_id}
+                )
+            else:
+                effective_depot_id = "UNKNOWN"
+                unknown_unassigned.append(page_num)
+        else:
+            effective_depot_id = depot_id_raw
+            last_depot_id = depot_id_raw
+
+        depot_pages.setdefault(effective_depot_id, []).append(page_index)
+        log_lines.append(
+            f"Page {page_num}: extracted Depot ID {depot_id_raw}, "
+            f"assigned to group {effective_depot_id}"
+        )
+
+    return {
+        "num_pages": len(page_texts),
+        "log_lines": log_lines,
+        "depot_ids": list(depot_pages.keys()),
+        "unknown_attached": unknown_attached,
+        "unknown_unassigned": unknown_unassigned,
+        "zip_bytes": _zip_groups(pdf_bytes, depot_pages, depot_id_to_filename),
+    }
+
+
+@st.cache_data(show_spinner=True, max_entries=_SPLIT_CACHE_ENTRIES, ttl=_SPLIT_CACHE_TTL)
+def split_group_list(pdf_bytes: bytes) -> dict:
+    """
+    Split a Group List PDF by Shipping Point.
+
+    Returns a dict with:
+      - num_pages, log_lines
+      - shipping_points: groups in order of first appearance
+      - ignored_pages: pages with no valid 3-digits+V shipping point
+      - zip_bytes: one '<sp>_Group.pdf' per shipping point, or None if
+        no page had a valid shipping point
+    """
+    page_texts = _page_texts(pdf_bytes)
+
+    sp_pages = {}  # shipping_point -> [page_index, ...]
+    ignored_pages = []  # pages with no valid 3-digits+V shipping point
+    log_lines = []      # per-page log, shown once after the loop
+
+    for page_index, text in enumerate(page_texts):
+        page_num = page_index + 1
+        sp = extract_shipping_point_from_text(text)
+
+        if sp == "UNKNOWN":
+            ignored_pages.append(page_num)
+            log_lines.append(f"Page {page_num}: no valid Shipping Point (ignored).")
+            continue  # skip this page entirely
+
+        sp_pages.setdefault(sp, []).append(page_index)
+        log_lines.append(f"Page {page_num}: Shipping Point {sp}")
+
+    zip_bytes = None
+    if sp_pages:
+        zip_bytes = _zip_groups(pdf_bytes, sp_pages, shipping_point_to_filename)
+
+    return {
+        "num_pages": len(page_texts),
+        "log_lines": log_lines,
+        "shipping_points": list(sp_pages.keys()),
+        "ignored_pages": ignored_pages,
+        "zip_bytes": zip_bytes,
+    }
+
+
 # --------- Streamlit App Layout --------- #
 
 st.set_page_config(page_title="Messer PDF Tools", page_icon="📄", layout="wide")
@@ -136,77 +385,30 @@ if page == "Call List Splitter":
 
         if st.button("🚀 Split Call List by Depot ID"):
             try:
-                uploaded_file.seek(0)
-
-                reader = PdfReader(uploaded_file)
-                num_pages = len(reader.pages)
-                st.write(f"Detected **{num_pages}** pages.")
-
-                depot_writers = {}
-                last_depot_id = None
-
-                unknown_attached = []   # pages with UNKNOWN attached to previous depot
-                unknown_unassigned = [] # pages truly left as UNKNOWN
-
-                # Process each page
-                for page_index, page in enumerate(reader.pages):
-                    page_num = page_index + 1
-                    depot_id_raw = extract_depot_id(page)
-
-                    if depot_id_raw == "UNKNOWN":
-                        if last_depot_id is not None:
-                            effective_depot_id = last_depot_id
-                            unknown_attached.append(
-                                {"page": page_num, "assigned_to": last_depot_id}
-                            )
-                        else:
-                            effective_depot_id = "UNKNOWN"
-                            unknown_unassigned.append(page_num)
-                    else:
-                        effective_depot_id = depot_id_raw
-                        last_depot_id = depot_id_raw
-
-                    if effective_depot_id not in depot_writers:
-                        depot_writers[effective_depot_id] = PdfWriter()
-
-                    depot_writers[effective_depot_id].add_page(page)
-                    st.write(
-                        f"Page {page_num}: extracted Depot ID `{depot_id_raw}`, "
-                        f"assigned to group `{effective_depot_id}`"
-                    )
+                result = split_call_list(uploaded_file.getvalue())
+                st.write(f"Detected **{result['num_pages']}** pages.")
+
+                st.expander("Per-page log").code("\n".join(result["log_lines"]))
 
-                depot_ids = list(depot_writers.keys())
                 st.write("### Depot groups created:")
-                st.json(depot_ids)
+                st.json(result["depot_ids"])
 
-                if unknown_attached:
+                if result["unknown_attached"]:
                     st.warning("Some pages had no Depot ID match and were attached to the previous depot:")
-                    st.table(unknown_attached)
+                    st.table(result["unknown_attached"])
 
-                if unknown_unassigned:
+                if result["unknown_unassigned"]:
                     st.error(
                         "Some pages had no Depot ID and no previous depot to attach to. "
                         "They were grouped under 'UNKNOWN'."
                     )
-                    st.write("Pages grouped as UNKNOWN:", unknown_unassigned)
-
-                # Create ZIP in memory
-                zip_buffer = io.BytesIO()
-                with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
-                    for depot_id, writer in depot_writers.items():
-                        filename = depot_id_to_filename(depot_id)
-                        pdf_bytes = io.BytesIO()
-                        writer.write(pdf_bytes)
-                        pdf_bytes.seek(0)
-                        zip_file.writestr(filename, pdf_bytes.read())
-
-                zip_buffer.seek(0)
+                    st.write("Pages grouped as UNKNOWN:", result["unknown_unassigned"])
 
                 st.success("Splitting complete! Download your ZIP below:")
 
                 st.download_button(
                     label="⬇️ Download Call List ZIP",
-                    data=zip_buffer,
+                    data=result["zip_bytes"],
                     file_name="call_lists_by_depot.zip",
                     mime="application/zip",
                 )
@@ -240,59 +442,30 @@ elif page == "Group List Splitter":
 
         if st.button("🚀 Split Group List by Shipping Point"):
             try:
-                group_file.seek(0)
-                reader = PdfReader(group_file)
-                num_pages = len(reader.pages)
-                st.write(f"Detected **{num_pages}** pages.")
-
-                # shipping_point -> PdfWriter
-                sp_writers = {}
-                ignored_pages = []  # pages with no valid 3-digits+V shipping point
+                result = split_group_list(group_file.getvalue())
+                st.write(f"Detected **{result['num_pages']}** pages.")
 
-                for page_index, page in enumerate(reader.pages):
-                    page_num = page_index + 1
-                    sp = extract_shipping_point(page)
+                st.expander("Per-page log").code("\n".join(result["log_lines"]))
 
-                    if sp == "UNKNOWN":
-                        ignored_pages.append(page_num)
-                        st.write(f"Page {page_num}: no valid Shipping Point (ignored).")
-                        continue  # skip this page entirely
+                ignored_pages = result["ignored_pages"]
 
-                    if sp not in sp_writers:
-                        sp_writers[sp] = PdfWriter()
-
-                    sp_writers[sp].add_page(page)
-                    st.write(f"Page {page_num}: Shipping Point `{sp}`")
-
-                if not sp_writers:
+                if not result["shipping_points"]:
                     st.error("No valid Shipping Point (3 digits + 'V') found on any page. Nothing to split.")
                     if ignored_pages:
                         st.write("Pages scanned but ignored:", ignored_pages)
                 else:
                     st.write("### Shipping Points created:")
-                    st.json(list(sp_writers.keys()))
+                    st.json(result["shipping_points"])
 
                     if ignored_pages:
                         st.info("Some pages had no valid Shipping Point and were ignored:")
                         st.write(ignored_pages)
 
-                    # Create ZIP in memory
-                    zip_buffer = io.BytesIO()
-                    with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
-                        for sp, writer in sp_writers.items():
-                            filename = shipping_point_to_filename(sp)
-                            pdf_bytes = io.BytesIO()
-                            writer.write(pdf_bytes)
-                            pdf_bytes.seek(0)
-                            zip_file.writestr(filename, pdf_bytes.read())
-
-                    zip_buffer.seek(0)
-
                     st.success("Group List splitting complete! Download your ZIP below:")
 
                     st.download_button(
                         label="⬇️ Download Group List ZIP",
-                        data=zip_buffer,
+                        data=result["zip_bytes"],
                         file_name="group_lists_by_shipping_point.zip",
                         mime="application/zip",
                     )
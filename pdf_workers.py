@@ -0,0 +1,86 @@
+"""
+Functions run inside worker processes.
+
+PyMuPDF is not thread-safe (and holds the GIL), so parallel work is done
+in a process pool. These live outside app.py because Streamlit executes
+app.py as a script, and functions defined there cannot be pickled.
+"""
+import pymupdf
+
+
+def _page_text(doc, i: int) -> str:
+    """
+    Extract the text of page `i`.
+
+    A page whose resources reference no font at all (e.g. a scanned image)
+    and that has no annotations or form widgets cannot contain text, so ""
+    is returned without running the text extractor. Annotations and widgets
+    are checked too: get_text() includes their text, but their fonts live
+    in appearance streams, not in the page's resources.
+    """
+    page = doc[i]
+    if (not doc.get_page_fonts(i, full=True)
+            and page.first_annot is None and page.first_widget is None):
+        return ""
+    return page.get_text("text") or ""
+
+
+def doc_page_texts(doc, start: int, stop: int) -> list[str]:
+    """
+    Extract the text of pages [start, stop) of an open document.
+    """
+    texts = [_page_text(doc, i) for i in range(start, stop)]
+    # Warnings are still collected in memory; drop them so a long-running
+    # Streamlit server doesn't accumulate them across uploads.
+    pymupdf.TOOLS.reset_mupdf_warnings()
+    return texts
+
+
+def extract_page_texts(pdf_path: str, start: int, stop: int) -> list[str]:
+    """
+    Process-pool entry point: open the PDF at `pdf_path` and extract the
+    text of pages [start, stop).
+    """
+    with pymupdf.open(pdf_path) as doc:
+        return doc_page_texts(doc, start, stop)
+
+
+def _page_runs(page_indices: list[int]):
+    """
+    Yield (first, last) for each run of consecutive page indices,
+    e.g. [0, 1, 2, 5, 6] → (0, 2), (5, 6).
+    """
+    first = last = None
+    for i in page_indices:
+        if last is not None and i == last + 1:
+            last = i
+            continue
+        if first is not None:
+            yield first, last
+        first = last = i
+    if first is not None:
+        yield first, last
+
+
+def build_pdf(doc, page_indices: list[int]) -> bytes:
+    """
+    Build a new PDF from the given pages of `doc`.
+
+    Consecutive pages are copied with a single insert_pdf() call, so shared
+    resources are grafted once per run instead of once per page. The output
+    document is closed before returning, so only its serialized bytes stay
+    in memory while the ZIP is assembled.
+    """
+    with pymupdf.open() as out:
+        for first, last in _page_runs(page_indices):
+            out.insert_pdf(doc, from_page=first, to_page=last)
+        return out.tobytes()
+
+
+def build_pdfs(pdf_path: str, page_lists: list) -> list[bytes]:
+    """
+    Process-pool entry point: open the PDF at `pdf_path` and build one PDF
+    per list of page indices.
+    """
+    with pymupdf.open(pdf_path) as doc:
+        return [build_pdf(doc, page_indices) for page_indices in page_lists]
@@ -0,0 +1,80 @@
+"""
+The field extractors take shortcuts (sentinel checks, literal searches,
+header-first regex search) in front of the regexes. These tests check
+that they return the same value as a plain search of the whole page.
+"""
+import random
+import unittest
+
+import app
+
+# Label spellings, digits and separators the shortcuts have to get right,
+# including non-ASCII case variants and digits matched by IGNORECASE / \d.
+_DEPOT_TOKENS = [
+    "Depot ID", "depot id", "Depot İD", "DEPOT ıD", "Depot",
+    "1:342104", "2104", "1111", "12", "٣١٠٥",
+    "\n", "\r", " ", "\t", "\x1c", "\xa0", "\u2028", ":",
+    "x" * 70, "y" * 400,
+]
+
+_SHIPPING_TOKENS = [
+    "Shipping Point", "shipping point", " : ", ":", "123V", "140V", "12V", "123v",
+    "١٢٣V", "\n", " ", "\xa0", "x" * 70, "y" * 400,
+]
+
+
+def _random_texts(seed: int, count: int, tokens: list[str]):
+    rng = random.Random(seed)
+    for _ in range(count):
+        yield "".join(rng.choice(tokens) for _ in range(rng.randint(0, 14)))
+
+
+def _depot_id_by_regex(text: str) -> str:
+    match = app._DEPOT_COMBINED.search(text)
+    return (match.group("a") or match.group("b")) if match else "UNKNOWN"
+
+
+class DepotIdTest(unittest.TestCase):
+    def test_layouts(self):
+        self.assertEqual(app.extract_depot_id_from_text("x 1:342104\nDepot ID"), "2104")
+        self.assertEqual(app.extract_depot_id_from_text("2104  \r\n  Depot ID"), "2104")
+        self.assertEqual(app.extract_depot_id_from_text("Depot ID : 3105"), "3105")
+        self.assertEqual(app.extract_depot_id_from_text("y" * 5000 + "1234\n Depot ID"), "1234")
+        self.assertEqual(app.extract_depot_id_from_text("nothing"), "UNKNOWN")
+        self.assertEqual(app.extract_depot_id_from_text(""), "UNKNOWN")
+
+    def test_earlier_label_in_another_spelling_wins(self):
+        self.assertEqual(
+            app.extract_depot_id_from_text("Depot İD: 1111\n2104\nDepot ID"), "1111"
+        )
+
+    def test_matches_full_regex_search(self):
+        for text in _random_texts(seed=20, count=20000, tokens=_DEPOT_TOKENS):
+            self.assertEqual(
+                app.extract_depot_id_from_text(text), _depot_id_by_regex(text), repr(text)
+            )
+
+
+class ShippingPointTest(unittest.TestCase):
+    def test_layouts(self):
+        self.assertEqual(
+            app.extract_shipping_point_from_text("Shipping Point    :  140V  Messer"), "140V"
+        )
+        self.assertEqual(
+            app.extract_shipping_point_from_text("z" * 3000 + "Shipping Point : 123V"), "123V"
+        )
+        self.assertEqual(app.extract_shipping_point_from_text("Shipping Point : 12V"), "UNKNOWN")
+        self.assertEqual(app.extract_shipping_point_from_text(""), "UNKNOWN")
+
+    def test_matches_full_regex_search(self):
+        for text in _random_texts(seed=21, count=20000, tokens=_SHIPPING_TOKENS):
+            match = app._SHIPPING_POINT.search(text)
+            self.assertEqual(
+                app.extract_shipping_point_from_text(text),
+                match.group(1) if match else "UNKNOWN",
+                repr(text),
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()